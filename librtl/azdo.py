@@ -1,7 +1,9 @@
 """This python script creates pull requests on Azure Devops this requires
 Azure devops modules to work with the azure API.
 """
+from collections import defaultdict
 import textwrap
+import time
 
 from msrest.authentication import BasicAuthentication
 from azure.devops.connection import Connection
@@ -10,8 +12,12 @@ from azure.devops.v5_1.git.models import (
     Comment, GitPullRequestCommentThread
 )
 
+from librtl.cache import ResponseCache
 from librtl.model import ManagedRepository
 
+PAGE_SIZE = 100
+SNAPSHOT_MAX_AGE = 60
+
 class PRStatus():
     """Simple Enumeration of the status a PR task can have with appropriate strings
     This will be used by the function pr_description for the status. There will be a
@@ -22,19 +28,66 @@ class PRStatus():
     PENDING = "Pending"
     
 
+class ProjectSnapshot():
+    """Point in time index of the repositories and active pull requests of a project
+
+    Pull requests are partitioned by the id of the repository they target so every repo in
+    the project can be served from a single project wide fetch.
+    """
+
+    def __init__(self, project: str, repos, pull_requests):
+        """
+        :param project: name of the project eg RunwayTest
+        :param repos: iterable of GitRepository
+        :param pull_requests: iterable of dicts created by GitPullRequest.as_dict()
+        """
+        self.project = project
+        self.taken_at = time.monotonic()
+        self._repos = {}
+        for remote in repos:
+            self._repos[remote.id] = remote
+            self._repos[remote.name.lower()] = remote
+        self._prs = defaultdict(list)
+        for pr in pull_requests:
+            self._prs[pr["repository"]["id"]].append(pr)
+
+    def is_fresh(self, max_age):
+        """Returns True if the snapshot was taken less than max_age seconds ago
+        """
+        return time.monotonic() - self.taken_at < max_age
+
+    def repo(self, name_or_id: str):
+        """Returns the GitRepository with the name or id, or None if it was not in the project
+        """
+        return self._repos.get(name_or_id, self._repos.get(name_or_id.lower()))
+
+    def pull_requests(self, repo_id: str):
+        """Returns a list of the pull requests targeting the repository id
+        """
+        return list(self._prs.get(repo_id, []))
+
 class AzureDevOpsInteractor():
     """Contains functions which use Azure DevOps
     """
 
-    def __init__(self, token):
+    def __init__(
+            self, token, cache_dir=ResponseCache.DEFAULT_DIR, snapshot_max_age=SNAPSHOT_MAX_AGE):
         """The __init__ function loads the credentials and does the authentication
         with the AzureDevOpsInteractor. The credentials are token based and are defined
         by AZDO_TOKEN environment varriable.
+
+        GET requests are revalidated against an on disk ResponseCache in cache_dir, which
+        may be None to always download full responses. Project snapshots are reused for
+        snapshot_max_age seconds.
         """
+        self._snapshots = {}
+        self._snapshot_max_age = snapshot_max_age
 
         credentials = BasicAuthentication("", token)
         connection = Connection("https://jet2tfs.visualstudio.com", creds=credentials)
         self._azdo = connection.clients.get_git_client()
+        if cache_dir is not None:
+            ResponseCache(cache_dir).install(self._azdo)
 
     def create_repo(self, project: str, name: str):
         """Create a new ManagedRepository inside the project
@@ -54,26 +107,102 @@ class AzureDevOpsInteractor():
         :param name: name of the repo eg WorldDomination
         :returns: ManagedRepository
         """
-        return ManagedRepository(
-            self._azdo.get_repository(repository_id=name, project=project),
-            self.pull_requests_for_repo(project, name)
-        )
+        snapshot, remote = self._snapshot_with_repo(project, name)
+        return ManagedRepository(remote, snapshot.pull_requests(remote.id))
+
+    def project_snapshot(self, project: str, refresh=False):
+        """Get a ProjectSnapshot of the project, fetching one if there is no fresh snapshot
+
+        :param project: name of the project eg RunwayTest
+        :param refresh: fetch a new snapshot even if the current one is fresh
+        :returns: ProjectSnapshot
+        """
+        snapshot = self._snapshots.get(project)
+        if refresh or snapshot is None or not snapshot.is_fresh(self._snapshot_max_age):
+            snapshot = ProjectSnapshot(
+                project,
+                self._azdo.get_repositories(project=project),
+                self.iter_pull_requests(project)
+            )
+            self._snapshots[project] = snapshot
+        return snapshot
+
+    def _snapshot_with_repo(self, project: str, name: str):
+        """Get the project snapshot and the named GitRepository from it
+
+        A reused snapshot without the repo is refreshed once, in case the repo was created
+        after it was taken. Repos missing from a fresh snapshot are loaded on their own.
+        """
+        reused = self._snapshots.get(project)
+        snapshot = self.project_snapshot(project)
+        remote = snapshot.repo(name)
+        if remote is None and snapshot is reused:
+            snapshot = self.project_snapshot(project, refresh=True)
+            remote = snapshot.repo(name)
+        if remote is None:
+            remote = self._azdo.get_repository(repository_id=name, project=project)
+        return snapshot, remote
 
     def pull_requests_for_repo(self, project: str, name: str):
         """Get a list of pull requests for the named repo
 
-        Each pull request is created by GitPullRequest.as_dict()
+        Each pull request is created by GitPullRequest.as_dict(). Served from the project
+        snapshot, so the pull requests of the whole project are fetched at most once per
+        snapshot_max_age seconds.
 
         :param project: name of the project eg RunwayTest
         :param name: name of the repo eg WorldDomination
         :returns: list(dict)
         """
-        repo_id = self._azdo.get_repository(repository_id=name, project=project).as_dict()["id"]
-        pr_search = GitPullRequestSearchCriteria(repository_id=repo_id)
-        results = []
-        for result in self._azdo.get_pull_requests_by_project(project, pr_search, top=1000):
-            results.append(result.as_dict())
-        return results
+        snapshot, remote = self._snapshot_with_repo(project, name)
+        return snapshot.pull_requests(remote.id)
+
+    def iter_pull_requests(
+            self, project: str, repo=None, status=None, source=None, target=None,
+            page_size=PAGE_SIZE):
+        """Lazily yield the pull requests of a project one page at a time
+
+        Each pull request is created by GitPullRequest.as_dict(). Pages are only requested
+        as the caller consumes the generator, so the first result is available after a single
+        round trip and memory use does not grow with the size of the project.
+
+        The branch arguments (source and target) must not have the 'refs/heads/' prefix as
+        this prefix is added by the method.
+
+        :param project: name of the project eg RunwayTest
+        :param repo: name of the repo to restrict the search to eg WorldDomination
+        :param status: one of active, abandoned, completed or all [default: active]
+        :param source: name of the source branch eg feature/123-TacoTuesday
+        :param target: name of the target branch eg develop
+        :param page_size: number of pull requests to request per page
+        :returns: generator(dict)
+        """
+        pr_search = GitPullRequestSearchCriteria(
+            repository_id=self.get_repo(project, repo).id if repo else None,
+            status=status,
+            source_ref_name=f"refs/heads/{source}" if source else None,
+            target_ref_name=f"refs/heads/{target}" if target else None
+        )
+        skip = 0
+        while True:
+            page = self._azdo.get_pull_requests_by_project(
+                project, pr_search, skip=skip, top=page_size)
+            for result in page:
+                yield result.as_dict()
+            if len(page) < page_size:
+                return
+            skip += page_size
+
+    def iter_repos(self, project: str):
+        """Lazily yield the repositories of a project
+
+        Each repository is created by GitRepository.as_dict()
+
+        :param project: name of the project eg RunwayTest
+        :returns: generator(dict)
+        """
+        for remote in self._azdo.get_repositories(project=project):
+            yield remote.as_dict()
 
     def create_thread(self, project: str, repo: str, source: str, destination: str, initial_comment: str):
         """Create a thread in an existing PR in Azure Devops
@@ -116,7 +245,10 @@ class AzureDevOpsInteractor():
             description=AzureDevOpsInteractor.pr_description(),
             is_draft=is_draft
         )
-        return self._azdo.create_pull_request(pr_create, repo_id)
+        pull_request = self._azdo.create_pull_request(pr_create, repo_id)
+        # The new PR is not in the project snapshot
+        self._snapshots.pop(project, None)
+        return pull_request
 
     def load_pull_request(self, project: str, repo: str, title: str):
         """Load a single pull request as a dict using the title
@@ -128,9 +260,16 @@ class AzureDevOpsInteractor():
         :param title: title of the PR eg 'RouteToLive: feature/123-TacoTuesday'
         :returns: dict representing the pull request
         """
+        reused = self._snapshots.get(project)
         for pr in self.pull_requests_for_repo(project, repo):
             if pr["title"] == title:
                 return pr
+        if reused is not None and self._snapshots.get(project) is reused:
+            # Another process may have created the PR since the snapshot was taken
+            self.project_snapshot(project, refresh=True)
+            for pr in self.pull_requests_for_repo(project, repo):
+                if pr["title"] == title:
+                    return pr
         return None
 
     def get_repo(self, project: str, repo: str):
@@ -143,6 +282,11 @@ class AzureDevOpsInteractor():
         :param repo: name of the repo eg WorldDomination
         :returns: GitRepository
         """
+        snapshot = self._snapshots.get(project)
+        if snapshot is not None and snapshot.is_fresh(self._snapshot_max_age):
+            remote = snapshot.repo(repo)
+            if remote is not None:
+                return remote
         return self._azdo.get_repository(repository_id=repo, project=project)
 
     @staticmethod
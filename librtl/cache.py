@@ -0,0 +1,173 @@
+"""On disk HTTP response cache shared by every librtl process on the same machine
+
+GET responses carrying an ETag or Last-Modified header are stored on disk and revalidated
+with a conditional request the next time the same URL is requested. A 304 Not Modified is
+answered from the stored body so the payload only crosses the network when it has changed.
+"""
+import contextlib
+import hashlib
+import json
+import os
+import tempfile
+
+from requests.adapters import HTTPAdapter
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from librtl.paths import private_dir, user_dir
+
+class ResponseCache():
+    """Size bounded store of HTTP responses keyed by request
+
+    Entries are single files written atomically with os.replace, so concurrent processes can
+    share a directory without locking. When the directory grows past max_bytes the least
+    recently used entries are evicted. The cache is best effort: failing to read or write it
+    never fails the request. Caching is disabled unless directory is private to the current
+    user, as whoever can write to it decides what is replayed as a response.
+    """
+    DEFAULT_DIR = user_dir("librtl-http-cache")
+    DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+    # Headers describing the wire encoding of the original response, which no longer apply
+    # to the decoded body held in the cache
+    HOP_HEADERS = ("content-encoding", "content-length", "transfer-encoding", "connection")
+
+    def __init__(self, directory=DEFAULT_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.enabled = private_dir(directory)
+
+    @staticmethod
+    def key(request):
+        """Return the cache key for a requests.PreparedRequest
+
+        The credentials are part of the key so different tokens never share an entry.
+        """
+        identity = "\n".join([
+            request.method,
+            request.url,
+            request.headers.get("Accept", ""),
+            request.headers.get("Authorization", "")
+        ])
+        return hashlib.sha256(identity.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def load(self, key):
+        """Return (headers, body) of a stored response or None
+
+        The headers are a CaseInsensitiveDict, as on a requests.Response.
+        """
+        if not self.enabled:
+            return None
+        try:
+            with open(self._path(key), "rb") as inf:
+                headers = CaseInsensitiveDict(json.loads(inf.readline().decode("utf-8")))
+                body = inf.read()
+            os.utime(self._path(key))
+        except (OSError, ValueError):
+            return None
+        return headers, body
+
+    def store(self, key, response):
+        """Store a requests.Response, then evict down to max_bytes
+        """
+        if not self.enabled:
+            return
+        headers = {
+            name: value for name, value in response.headers.items()
+            if name.lower() not in ResponseCache.HOP_HEADERS
+        }
+        tmp_path = None
+        try:
+            handle, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+            with os.fdopen(handle, "wb") as opf:
+                opf.write(json.dumps(headers).encode("utf-8") + b"\n")
+                opf.write(response.content)
+            os.replace(tmp_path, self._path(key))
+            self.evict()
+        except OSError:
+            if tmp_path is not None:
+                with contextlib.suppress(OSError):
+                    os.remove(tmp_path)
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits in max_bytes
+        """
+        entries = []
+        with contextlib.suppress(OSError), os.scandir(self.directory) as scan:
+            for entry in scan:
+                with contextlib.suppress(OSError):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            with contextlib.suppress(OSError):
+                os.remove(path)
+            total -= size
+
+    def install(self, client):
+        """Route the GET requests of an azure.devops Client through this cache
+
+        Uses the msrest session configuration callback, which is invoked with the session
+        before every request, to mount a ConditionalRequestAdapter in place of the default.
+        """
+        def configure_session(session, global_config, local_config, **kwargs):  # pylint: disable=unused-argument
+            for prefix in ("https://", "http://"):
+                adapter = session.adapters.get(prefix)
+                if not isinstance(adapter, ConditionalRequestAdapter):
+                    retries = adapter.max_retries if adapter is not None else 0
+                    session.mount(prefix, ConditionalRequestAdapter(self, max_retries=retries))
+            return kwargs
+        client.config.session_configuration_callback = configure_session
+
+class ConditionalRequestAdapter(HTTPAdapter):
+    """requests transport adapter revalidating GET requests against a ResponseCache
+    """
+
+    def __init__(self, cache, **kwargs):
+        self.cache = cache
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):  # pylint: disable=arguments-differ
+        if request.method != "GET":
+            return super().send(request, **kwargs)
+        key = ResponseCache.key(request)
+        cached = self.cache.load(key)
+        if cached is not None:
+            headers, _ = cached
+            if "ETag" in headers:
+                request.headers["If-None-Match"] = headers["ETag"]
+            if "Last-Modified" in headers:
+                request.headers["If-Modified-Since"] = headers["Last-Modified"]
+        response = super().send(request, **kwargs)
+        if response.status_code == 304 and cached is not None:
+            return ConditionalRequestAdapter._replay(request, response, *cached)
+        if response.status_code == 200 and (
+                "ETag" in response.headers or "Last-Modified" in response.headers):
+            self.cache.store(key, response)
+        return response
+
+    @staticmethod
+    def _replay(request, not_modified, headers, body):
+        """Build a 200 response from a cached entry and the 304 that revalidated it
+        """
+        response = Response()
+        response.status_code = 200
+        response.reason = "OK"
+        response.headers = CaseInsensitiveDict(headers)
+        response.headers.update(not_modified.headers)
+        for name in ResponseCache.HOP_HEADERS:
+            response.headers.pop(name, None)
+        response.encoding = get_encoding_from_headers(response.headers)
+        response._content = body  # pylint: disable=protected-access
+        response.url = request.url
+        response.request = request
+        response.connection = not_modified.connection
+        response.elapsed = not_modified.elapsed
+        response.from_cache = True
+        not_modified.close()
+        return response
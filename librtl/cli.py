@@ -2,14 +2,26 @@
 """CLI for librtl
 """
 import argparse
+import fnmatch
+import json
 import os
+import signal
 import sys
 
 from librtl.azdo import AzureDevOpsInteractor
+from librtl.daemon import DEFAULT_SOCKET, RtlDaemon, forward
 
 from librtl.__version__ import __version__ as VERSION
 
 class CLI():
+    # One client per token, kept for the life of the process so a daemon stays authenticated
+    _clients = {}
+
+    @staticmethod
+    def client(token):
+        if token not in CLI._clients:
+            CLI._clients[token] = AzureDevOpsInteractor(token)
+        return CLI._clients[token]
 
     @staticmethod
     def process_globals(arguments):
@@ -22,13 +34,13 @@ class CLI():
 
     @staticmethod
     def create_pr(arguments):
-        client = AzureDevOpsInteractor(arguments.token)
+        client = CLI.client(arguments.token)
         client.create_pull_request(arguments.project, arguments.repo, arguments.source, arguments.destination)
         print(f"Created PR successfully from {arguments.source} to {arguments.destination} for {arguments.project}/{arguments.repo}")
 
     @staticmethod
     def create_thread(arguments):
-        client = AzureDevOpsInteractor(arguments.token)
+        client = CLI.client(arguments.token)
         pullrequest = client.load_pull_request(arguments.project, arguments.repo, arguments.source) 
         if pullrequest is None:
             print("No Pull Request Found.")
@@ -36,9 +48,89 @@ class CLI():
         client.create_thread(arguments.repo, arguments.project, arguments.artifact, pullrequest["pull_request_id"])        
         print(f"Created Thread successfully for {pullrequest['title']}")
 
-def main(args=None):
+    @staticmethod
+    def select(record, fields):
+        if not fields:
+            return record
+        selected = {}
+        for field in fields:
+            value = record
+            for key in field.split("."):
+                value = value.get(key) if isinstance(value, dict) else None
+            selected[field] = value
+        return selected
+
+    @staticmethod
+    def stream(records, fields=None):
+        try:
+            for record in records:
+                sys.stdout.write(json.dumps(CLI.select(record, fields), default=str) + "\n")
+                sys.stdout.flush()
+        except BrokenPipeError:
+            # The reader went away (eg `| head`), stop fetching pages and exit quietly. Point a
+            # real stdout at devnull so flushing it at exit does not raise again; output
+            # captured by the daemon has no file descriptor and is left alone.
+            try:
+                stdout_fd = sys.stdout.fileno()
+            except (OSError, ValueError):
+                stdout_fd = None
+            if stdout_fd is not None:
+                devnull = os.open(os.devnull, os.O_WRONLY)
+                try:
+                    os.dup2(devnull, stdout_fd)
+                finally:
+                    os.close(devnull)
+            sys.exit(1)
+
+    @staticmethod
+    def list_prs(arguments):
+        client = CLI.client(arguments.token)
+        CLI.stream(
+            client.iter_pull_requests(
+                arguments.project, repo=arguments.repo, status=arguments.status,
+                source=arguments.source, target=arguments.target
+            ),
+            arguments.fields
+        )
+
+    @staticmethod
+    def list_repos(arguments):
+        client = CLI.client(arguments.token)
+        CLI.stream(
+            (repo for repo in client.iter_repos(arguments.project) if fnmatch.fnmatch(repo["name"], arguments.name)),
+            arguments.fields
+        )
+
+    @staticmethod
+    def find_pr(arguments):
+        client = CLI.client(arguments.token)
+        pullrequest = client.load_pull_request(arguments.project, arguments.repo, arguments.title)
+        if pullrequest is None:
+            print("No Pull Request Found.", file=sys.stderr)
+            sys.exit(1)
+        CLI.stream([pullrequest], arguments.fields)
+
+    @staticmethod
+    def daemon(arguments):
+        try:
+            server = RtlDaemon(lambda args: main(args, use_daemon=False), arguments.socket, arguments.idle_timeout)
+        except RuntimeError as exc:
+            print(exc)
+            sys.exit(1)
+        # Exit through SystemExit on SIGTERM so the socket is removed
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        print(f"rtlctl daemon listening on {arguments.socket}")
+        sys.stdout.flush()
+        server.serve()
+
+def fields(value):
+    return [field.strip() for field in value.split(",") if field.strip()]
+
+def main(args=None, use_daemon=True):
     parser = argparse.ArgumentParser(description=f"rtlctl v{VERSION}")
     parser.add_argument("--token", default=None, type=str, help="Azure Devops Token to use [default: os.environ['AZDO_TOKEN']]")
+    parser.add_argument("--socket", default=os.environ.get("RTLCTL_SOCKET", DEFAULT_SOCKET), type=str, help=f"rtlctl daemon socket [default: os.environ['RTLCTL_SOCKET'] or {DEFAULT_SOCKET}]")
+    parser.add_argument("--no-daemon", action="store_true", default=False, help="Always run in this process, even when a daemon is listening")
     subparsers = parser.add_subparsers()
 
     create_pr = subparsers.add_parser("create-pr", help="Create an Azure Devops Pull Request for the Route to Live")
@@ -55,6 +147,32 @@ def main(args=None):
     create_thread.add_argument("artifact", help="Name of Artifact")
     create_thread.set_defaults(func=CLI.create_thread)
 
+    list_prs = subparsers.add_parser("list-prs", help="Stream the Pull Requests of a project as NDJSON")
+    list_prs.add_argument("project", help="Name of Azure Devops Project")
+    list_prs.add_argument("--repo", default=None, type=str, help="Only include Pull Requests into this repo")
+    list_prs.add_argument("--status", default=None, choices=["active", "abandoned", "completed", "all"], help="Pull Request status [default: active]")
+    list_prs.add_argument("--source", default=None, type=str, help="Only include Pull Requests from this branch")
+    list_prs.add_argument("--target", default=None, type=str, help="Only include Pull Requests into this branch")
+    list_prs.add_argument("--fields", default=None, type=fields, help="Comma separated fields to output, dotted for nesting eg pull_request_id,repository.name")
+    list_prs.set_defaults(func=CLI.list_prs)
+
+    list_repos = subparsers.add_parser("list-repos", help="Stream the repos of a project as NDJSON")
+    list_repos.add_argument("project", help="Name of Azure Devops Project")
+    list_repos.add_argument("--name", default="*", type=str, help="Only include repos whose name matches this glob [default: *]")
+    list_repos.add_argument("--fields", default=None, type=fields, help="Comma separated fields to output, dotted for nesting eg id,name")
+    list_repos.set_defaults(func=CLI.list_repos)
+
+    find_pr = subparsers.add_parser("find-pr", help="Output the first Pull Request with a title as NDJSON")
+    find_pr.add_argument("project", help="Name of Azure Devops Project")
+    find_pr.add_argument("repo", help="Name of Azure Devops Repo")
+    find_pr.add_argument("title", help="Title of the Pull Request eg 'RouteToLive: feature/Utopia'")
+    find_pr.add_argument("--fields", default=None, type=fields, help="Comma separated fields to output, dotted for nesting eg pull_request_id,title")
+    find_pr.set_defaults(func=CLI.find_pr)
+
+    daemon = subparsers.add_parser("daemon", help="Serve rtlctl commands from a warm process listening on --socket")
+    daemon.add_argument("--idle-timeout", default=3600, type=int, help="Seconds without a command before exiting, 0 to never exit [default: 3600]")
+    daemon.set_defaults(func=CLI.daemon)
+
     if args is None:
         try:
             args = sys.argv[1:]
@@ -67,7 +185,15 @@ def main(args=None):
         parser.print_help()
         sys.exit(1)
 
+    if arguments.func is CLI.daemon:
+        arguments.func(arguments)
+        return
+
     CLI.process_globals(arguments)
+    if use_daemon and not arguments.no_daemon:
+        status_code = forward(args, arguments.token, arguments.socket)
+        if status_code is not None:
+            sys.exit(status_code)
     arguments.func(arguments)
 
 if __name__ == "__main__":
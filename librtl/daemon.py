@@ -0,0 +1,293 @@
+"""Long lived rtlctl process answering commands over a Unix socket
+
+Starting a fresh rtlctl for every pipeline step pays for the imports, the Azure Devops
+authentication and any caches on every call. A daemon keeps all of that warm in one process;
+rtlctl forwards its arguments to the daemon when one is listening and runs in-process when not.
+
+The protocol is newline delimited JSON. The client sends a single request frame
+{"args": [...], "token": "..."} and the daemon replies with any number of
+{"stream": "stdout"|"stderr", "data": "..."} frames followed by a final {"exit": code}.
+
+The request carries the caller's token, so the client only talks to a socket owned by, and a
+daemon running as, the current user. The socket lives in $XDG_RUNTIME_DIR or a private
+directory under the temp dir.
+"""
+import contextlib
+import io
+import json
+import os
+import socket
+import socketserver
+import stat
+import struct
+import sys
+import threading
+import time
+import traceback
+
+from librtl.paths import private_dir, user_dir
+
+DEFAULT_DIR = os.environ.get("XDG_RUNTIME_DIR") or user_dir("rtlctl")
+DEFAULT_SOCKET = os.path.join(DEFAULT_DIR, "rtlctl.sock")
+CONNECT_TIMEOUT = 2
+# Longest a forwarded command may go without producing output before the client gives up
+READ_TIMEOUT = int(os.environ.get("RTLCTL_DAEMON_TIMEOUT", 600))
+
+def owned_socket(path):
+    """Returns True if path is a socket owned by the current user
+    """
+    try:
+        info = os.lstat(path)
+    except OSError:
+        return False
+    return stat.S_ISSOCK(info.st_mode) and info.st_uid == os.getuid()
+
+def peer_is_current_user(sock):
+    """Returns True if the process at the other end of a connected Unix socket runs as this user
+
+    Only checked where the platform supports SO_PEERCRED, otherwise the socket owner is trusted.
+    """
+    if not hasattr(socket, "SO_PEERCRED"):
+        return True
+    credentials = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i"))
+    _, uid, _ = struct.unpack("3i", credentials)
+    return uid == os.getuid()
+
+class ThreadOutput(io.TextIOBase):
+    """Stand in for sys.stdout or sys.stderr writing to a per thread stream when one is set
+
+    Lets the daemon capture the output of several commands running at once in its threads.
+    """
+
+    def __init__(self, default):
+        super().__init__()
+        self.default = default
+        self._local = threading.local()
+
+    @property
+    def target(self):
+        return getattr(self._local, "stream", None) or self.default
+
+    @target.setter
+    def target(self, stream):
+        self._local.stream = stream
+
+    def write(self, text):
+        return self.target.write(text)
+
+    def flush(self):
+        self.target.flush()
+
+    def fileno(self):
+        return self.target.fileno()
+
+def capture_output():
+    """Install ThreadOutput as sys.stdout and sys.stderr once, returning both
+    """
+    if not isinstance(sys.stdout, ThreadOutput):
+        sys.stdout = ThreadOutput(sys.stdout)
+    if not isinstance(sys.stderr, ThreadOutput):
+        sys.stderr = ThreadOutput(sys.stderr)
+    return sys.stdout, sys.stderr
+
+class FrameWriter(io.TextIOBase):
+    """Text stream sending everything written to it as frames on a socket file
+    """
+
+    def __init__(self, wfile, stream):
+        super().__init__()
+        self._wfile = wfile
+        self._stream = stream
+
+    def write(self, text):
+        send_frame(self._wfile, {"stream": self._stream, "data": text})
+        return len(text)
+
+def send_frame(wfile, frame):
+    """Write one JSON frame and flush it
+    """
+    wfile.write(json.dumps(frame).encode("utf-8") + b"\n")
+    wfile.flush()
+
+def exit_code(exc):
+    """Translate a SystemExit into a process exit code like the interpreter does
+    """
+    if exc.code is None:
+        return 0
+    if isinstance(exc.code, int):
+        return exc.code
+    print(exc.code, file=sys.stderr)
+    return 1
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    """Run one forwarded command and stream its output back
+
+    timeout only bounds reading the request. The output is written without one, so a slow
+    reader blocks the command as it would when run in-process.
+    """
+    timeout = CONNECT_TIMEOUT
+
+    def handle(self):
+        if not peer_is_current_user(self.connection):
+            return
+        try:
+            line = self.rfile.readline()
+        except socket.timeout:
+            return
+        if not line:
+            # A probe checking whether the daemon is alive
+            return
+        request = json.loads(line.decode("utf-8"))
+        args = list(request["args"])
+        if request.get("token") is not None:
+            args = ["--token", request["token"]] + args
+        self.connection.settimeout(None)
+        code = self.server.execute(args, self.wfile)
+        with contextlib.suppress(OSError):
+            send_frame(self.wfile, {"exit": code})
+
+class RtlDaemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Unix socket server running commands with a shared, warm, runner
+
+    The runner is called with the rtlctl argument list. Each command runs in its own thread
+    with its output captured by ThreadOutput, so commands from parallel steps run at once.
+    """
+    daemon_threads = True
+
+    def __init__(self, runner, socket_path=DEFAULT_SOCKET, idle_timeout=3600):
+        self.runner = runner
+        self.socket_path = socket_path
+        self.idle_timeout = idle_timeout
+        self.last_used = time.monotonic()
+        self.active = 0
+        self._active_lock = threading.Lock()
+        if os.path.dirname(socket_path) == DEFAULT_DIR and not private_dir(DEFAULT_DIR):
+            raise RuntimeError(
+                f"{DEFAULT_DIR} must be a directory owned by this user with mode 0700")
+        RtlDaemon.remove_stale_socket(socket_path)
+        old_umask = os.umask(0o077)
+        try:
+            super().__init__(socket_path, RequestHandler)
+        finally:
+            os.umask(old_umask)
+
+    @staticmethod
+    def remove_stale_socket(socket_path):
+        """Remove a socket file left behind by a daemon that is no longer running
+
+        :raises RuntimeError: when a daemon is still listening on the socket or the socket
+            belongs to another user
+        """
+        if not os.path.lexists(socket_path):
+            return
+        if not owned_socket(socket_path):
+            raise RuntimeError(f"{socket_path} exists and is not a socket owned by this user")
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(socket_path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            try:
+                os.remove(socket_path)
+            except PermissionError as exc:
+                raise RuntimeError(f"Cannot remove stale socket {socket_path}: {exc}")
+            return
+        except PermissionError as exc:
+            raise RuntimeError(f"Cannot use socket {socket_path}: {exc}")
+        finally:
+            probe.close()
+        raise RuntimeError(f"A daemon is already listening on {socket_path}")
+
+    def execute(self, args, wfile):
+        """Run the runner with output redirected to wfile and return the exit code
+        """
+        with self._active_lock:
+            self.active += 1
+        stdout, stderr = capture_output()
+        stdout.target, stderr.target = FrameWriter(wfile, "stdout"), FrameWriter(wfile, "stderr")
+        try:
+            self.runner(args)
+            code = 0
+        except SystemExit as exc:
+            code = exit_code(exc)
+        except BrokenPipeError:
+            code = 1
+        except Exception:  # pylint: disable=broad-except
+            with contextlib.suppress(OSError):
+                traceback.print_exc()
+            code = 1
+        finally:
+            stdout.target, stderr.target = None, None
+            with self._active_lock:
+                self.active -= 1
+                self.last_used = time.monotonic()
+        return code
+
+    def idle(self):
+        """Returns True when no command is running and none has for idle_timeout seconds
+        """
+        with self._active_lock:
+            if self.active:
+                return False
+            return time.monotonic() - self.last_used >= self.idle_timeout
+
+    def serve(self, poll_interval=1.0):
+        """Serve until idle for idle_timeout seconds (0 serves forever), then remove the socket
+
+        The daemon never times out while a command is running.
+        """
+        self.timeout = poll_interval
+        try:
+            while not self.idle_timeout or not self.idle():
+                self.handle_request()
+        finally:
+            self.server_close()
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(self.socket_path)
+
+def forward(args, token=None, socket_path=DEFAULT_SOCKET, stdout=None, stderr=None,
+            read_timeout=READ_TIMEOUT):
+    """Run a command in a listening daemon, relaying its output to this process
+
+    Nothing is sent unless the socket and the daemon behind it belong to the current user.
+
+    :param args: rtlctl argument list
+    :param token: Azure Devops token to run the command with
+    :param socket_path: location of the daemon socket
+    :param stdout: stream for the command's stdout [default: sys.stdout]
+    :param stderr: stream for the command's stderr [default: sys.stderr]
+    :param read_timeout: seconds to wait for output from the daemon before giving up
+    :returns: the exit code of the command, or None when no daemon of this user is listening
+    """
+    stdout, stderr = stdout or sys.stdout, stderr or sys.stderr
+    if not os.path.lexists(socket_path):
+        return None
+    if not owned_socket(socket_path):
+        print(f"Ignoring {socket_path}: not a socket owned by this user", file=stderr)
+        return None
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.settimeout(CONNECT_TIMEOUT)
+    try:
+        client.connect(socket_path)
+    except (OSError, socket.timeout):
+        client.close()
+        return None
+    if not peer_is_current_user(client):
+        client.close()
+        print(f"Ignoring {socket_path}: daemon is not running as this user", file=stderr)
+        return None
+    client.settimeout(read_timeout)
+    with client, client.makefile("rwb") as stream:
+        try:
+            send_frame(stream, {"args": list(args), "token": token})
+            for line in stream:
+                frame = json.loads(line.decode("utf-8"))
+                if "exit" in frame:
+                    return frame["exit"]
+                output = stdout if frame["stream"] == "stdout" else stderr
+                output.write(frame["data"])
+                output.flush()
+        except socket.timeout:
+            print(f"No response from the daemon on {socket_path} in {read_timeout}s", file=stderr)
+            return 1
+    # The daemon went away mid command
+    return 1
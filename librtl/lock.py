@@ -0,0 +1,36 @@
+"""Locks serialising work on the same managed repository
+"""
+import fcntl
+import os
+
+from librtl.paths import private_dir, user_dir
+
+class FileLock():
+    """Exclusive advisory lock held on a file, shared by every process of the current user
+
+    Used as a context manager around work that must not run concurrently for the same name.
+    The lock files live in a directory private to the user, so another user can neither hold
+    the lock nor block its creation; runs of different users are left to the push retries.
+    Any callable taking the name and returning a context manager can be used in its place,
+    for example a lock held in a shared service when runs span several users or machines.
+
+    :raises RuntimeError: on entry when directory is not owned by this user with mode 0700
+    """
+    DEFAULT_DIR = user_dir("librtl-locks")
+
+    def __init__(self, name, directory=DEFAULT_DIR):
+        self.path = os.path.join(directory, f"{name}.lock")
+        self._fd = None
+
+    def __enter__(self):
+        directory = os.path.dirname(self.path)
+        if not private_dir(directory):
+            raise RuntimeError(f"{directory} must be a directory owned by this user with mode 0700")
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc_details):
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+        os.close(self._fd)
+        self._fd = None
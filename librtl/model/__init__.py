@@ -1,11 +1,17 @@
 """Model objects for use by librtl
 """
 import os
+import random
+import time
 import uuid
 
-from git import Repo
+from git import GitCmdObjectDB, GitCommandError, Repo
+from gitdb import LooseObjectDB
 import jinja2
 
+from librtl.lock import FileLock
+from librtl.ssh import git_ssh_command
+
 class Templater():
     """Create common strings from known templates
     """
@@ -23,14 +29,41 @@ class Templater():
 
 TEMPLATER = Templater()
 
+class LooseObjectWriter(GitCmdObjectDB):
+    """GitPython object database writing new objects in-process
+
+    Reads still go through the long running git cat-file processes of GitCmdObjectDB, but
+    blobs, trees and commits are written as loose objects by gitdb instead of spawning a
+    git hash-object for each one.
+    """
+    store = LooseObjectDB.store
+
 class ManagedRepository():
     """Model representing an Azure Devops Git Repository managed by librtl
-    """
 
-    def __init__(self, remote, pull_requests):
+    Changes are pushed with push_with_retry, so a push rejected because another run updated
+    the branch first is rebased onto the remote and tried again. Work on the same repository
+    is serialised by the lock, a callable taking the repository id and returning a context
+    manager [default: FileLock]. Every git command run over ssh shares the master connection
+    of ssh_command [default: librtl.ssh.git_ssh_command()]; when there is none the ssh
+    settings of the environment and git config are left alone.
+    """
+    PUSH_ATTEMPTS = 5
+    PUSH_BACKOFF = 0.5
+    # Rejections caused by another push landing first, which a rebase can resolve. Anything
+    # else, such as a branch policy or a hook declining the push, is raised straight away.
+    REJECTED_PUSH = (
+        "fetch first", "non-fast-forward", "cannot lock ref",
+        # Azure Devops: the ref has already been updated by another client
+        "TF401028"
+    )
+
+    def __init__(self, remote, pull_requests, lock=FileLock, ssh_command=None):
         self._remote = remote.as_dict()
         self._prs = pull_requests
         self._local = None
+        self._lock = lock
+        self._ssh_command = ssh_command or git_ssh_command()
         self.id = self._remote["id"]
         self.project = self._remote["project"]["name"]
         self.name = self._remote["name"]
@@ -38,7 +71,18 @@ class ManagedRepository():
 
     def _check_config(self):
         local_path = os.path.join("/tmp", str(uuid.uuid4()))
-        self._local = Repo.clone_from(self._remote["ssh_url"], local_path)
+        env = {"GIT_SSH_COMMAND": self._ssh_command} if self._ssh_command else None
+        with self._lock(self.id):
+            Repo.clone_from(self._remote["ssh_url"], local_path, env=env)
+            self._local = Repo(local_path, odbt=LooseObjectWriter)
+            if env:
+                self._local.git.update_environment(**env)
+            self._add_essential_files()
+            self.push_with_retry(recompute=self._add_essential_files)
+        if not self.has_branch("develop"):
+            self.create_branch("develop")
+
+    def _add_essential_files(self):
         if not self.has_folder("rtl"):
             self.add_folder("rtl")
         if not self.has_file("rtl/self.yaml"):
@@ -78,26 +122,65 @@ class ManagedRepository():
                     {"name": self._remote["name"]}
                 )
             )
-        self._local.index.add(["rtl", "README.md"])
         self._local.index.commit("Add essential files for NewRouteToLive")
-        self._local.git.push()
-        if not self.has_branch("develop"):
-            self.create_branch("develop")
 
     def checkout(self, name):
         """git checkout branch
+
+        Switching to a local branch at the current commit only moves HEAD, which is done
+        in-process. Anything needing the working tree updated is left to git checkout.
         """
-        self._local.git.checkout(name)
+        if name in self._local.heads and self._local.heads[name].commit == self._local.head.commit:
+            self._local.head.reference = self._local.heads[name]
+        else:
+            self._local.git.checkout(name)
 
     def commit(self, message):
-        """git commit
+        """git commit, writing the tree and commit objects in-process
         """
-        self._local.git.commit('-m', message)
+        self._local.index.commit(message)
 
     def push(self):
         """git push
         """
-        self._local.git.push()
+        self.push_with_retry()
+
+    def push_with_retry(self, *args, recompute=None):
+        """git push the current branch, rebasing onto the remote when the push is rejected
+
+        Pushes rejected because the remote branch moved on, REJECTED_PUSH, are retried up to
+        PUSH_ATTEMPTS times with a jittered backoff starting at PUSH_BACKOFF seconds. When the
+        rebase conflicts and recompute is given, the branch is reset to the remote and
+        recompute is called to make and commit the change again.
+
+        :param args: arguments to git push
+        :param recompute: callable recreating the local commits on top of the remote
+        :raises GitCommandError: when the push fails for another reason or runs out of attempts
+        """
+        delay = ManagedRepository.PUSH_BACKOFF
+        for attempt in range(1, ManagedRepository.PUSH_ATTEMPTS + 1):
+            try:
+                self._local.git.push(*args)
+                return
+            except GitCommandError as exc:
+                rejected = any(reason in str(exc) for reason in ManagedRepository.REJECTED_PUSH)
+                if not rejected or attempt == ManagedRepository.PUSH_ATTEMPTS:
+                    raise
+            time.sleep(delay + random.uniform(0, delay))
+            delay *= 2
+            self._local.remotes.origin.fetch()
+            self._rebase(recompute)
+
+    def _rebase(self, recompute):
+        upstream = f"origin/{self._local.active_branch.name}"
+        try:
+            self._local.git.rebase(upstream)
+        except GitCommandError:
+            self._local.git.rebase("--abort")
+            if recompute is None:
+                raise
+            self._local.git.reset("--hard", upstream)
+            recompute()
 
     def has_branch(self, name):
         """Returns True if branch exists in the remote
@@ -106,11 +189,13 @@ class ManagedRepository():
 
     def create_branch(self, name, src="master"):
         """Create a branch in the managed repository
+
+        If another run creates the branch first the local branch is rebased onto it.
         """
-        self._local.git.checkout(src)
-        self._local.create_head(name)
-        self._local.git.checkout(name)
-        self._local.git.push("--set-upstream", "origin", name)
+        with self._lock(self.id):
+            self._local.create_head(name, src)
+            self.checkout(name)
+            self.push_with_retry("--set-upstream", "origin", name)
 
     def has_file(self, path):
         """Returns True if path exists and is a file
@@ -120,16 +205,17 @@ class ManagedRepository():
 
     def add_file(self, path, content):
         """Adds a file with the content at the path
+
+        The blob is written to the object database and staged in-process.
         """
         with open(os.path.join(self._local.working_tree_dir, path), "a+") as opf:
             opf.write(content)
-        self._local.git.add(path)
+        self._local.index.add([path])
 
     def update_file(self, path, additional_content):
         """Update an existing file in place
         """
         self.add_file(path, additional_content)
-        self._local.git.add(path)
 
     def has_folder(self, path):
         """Returns True if path exists and is a folder
@@ -0,0 +1,27 @@
+"""Per user directories for the state librtl keeps between runs
+"""
+import os
+import stat
+import tempfile
+
+def user_dir(name):
+    """Return the path of a directory for name private to the current user under the temp dir
+    """
+    return os.path.join(tempfile.gettempdir(), f"{name}-{os.getuid()}")
+
+def private_dir(path):
+    """Create path if needed and return True if it is a directory owned by this user, mode 0700
+
+    Anything else in a shared location such as /tmp may have been planted by another user,
+    who could then read or replace what is kept in it.
+    """
+    try:
+        os.makedirs(path, mode=0o700, exist_ok=True)
+        info = os.lstat(path)
+    except OSError:
+        return False
+    return (
+        stat.S_ISDIR(info.st_mode)
+        and info.st_uid == os.getuid()
+        and stat.S_IMODE(info.st_mode) == 0o700
+    )
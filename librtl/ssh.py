@@ -0,0 +1,53 @@
+"""Shared SSH connections for the git operations run by librtl
+
+Every clone, fetch and push over ssh otherwise opens its own connection and pays for a full
+handshake with the server. OpenSSH connection multiplexing keeps one master connection per
+host open in the background and runs later sessions over it.
+"""
+import os
+import shlex
+
+from git import Git, GitCommandError
+
+from librtl.paths import private_dir, user_dir
+
+DEFAULT_CONTROL_DIR = user_dir("librtl-ssh")
+DEFAULT_PERSIST = 600
+
+def git_ssh_command(persist=None, control_dir=DEFAULT_CONTROL_DIR):
+    """Return a GIT_SSH_COMMAND sharing one master connection per host, or None
+
+    Extends the ssh command git would otherwise use, GIT_SSH_COMMAND or core.sshCommand. The
+    master connection closes once it has been idle for persist, which takes any ssh
+    ControlPersist time such as 600 or 10m; 0 or no turns multiplexing off. Multiplexing is
+    also skipped when control_dir is not a directory private to the current user, as anyone
+    able to write to it could stand in for the master connection, and when GIT_SSH is set,
+    as its program may not take ssh options.
+
+    :param persist: idle time to keep a master open
+        [default: os.environ['RTL_SSH_PERSIST'] or 600]
+    :param control_dir: directory holding the master sockets
+    :returns: str, or None when git should be left to pick its ssh command itself
+    """
+    if persist is None:
+        persist = os.environ.get("RTL_SSH_PERSIST", DEFAULT_PERSIST)
+    persist = str(persist).strip()
+    if persist in ("", "0", "no") or os.environ.get("GIT_SSH"):
+        return None
+    if not private_dir(control_dir):
+        return None
+    command = os.environ.get("GIT_SSH_COMMAND") or configured_ssh_command()
+    # %C is a hash of the connection details, keeping the socket path under the length limit
+    control_path = shlex.quote(os.path.join(control_dir, "%C"))
+    return (
+        f"{command} -o ControlMaster=auto -o ControlPath={control_path}"
+        f" -o ControlPersist={shlex.quote(persist)}"
+    )
+
+def configured_ssh_command():
+    """Return the core.sshCommand from the user and system git config, or ssh
+    """
+    try:
+        return Git().config("--get", "core.sshCommand") or "ssh"
+    except GitCommandError:
+        return "ssh"
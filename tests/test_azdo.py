@@ -8,7 +8,7 @@ from contextlib import contextmanager
 import azure
 import git
 from pytest import raises
-from azure.devops.v5_1.git.models import GitRepository, TeamProjectReference
+from azure.devops.v5_1.git.models import GitPullRequest, GitRepository, TeamProjectReference
 
 from librtl.azdo import AzureDevOpsInteractor
 
@@ -45,3 +45,71 @@ def test_invalid_token_fails():
     with raises(azure.devops.exceptions.AzureDevOpsServiceError):
         client = AzureDevOpsInteractor('test-token')
         client.load_repo("", "")
+
+def offline_client():
+    client = AzureDevOpsInteractor.__new__(AzureDevOpsInteractor)
+    client._azdo = MagicMock()
+    client._snapshots = {}
+    client._snapshot_max_age = 60
+    return client
+
+def test_iter_pull_requests_pages_lazily():
+    client = offline_client()
+    pages = [
+        [MagicMock(**{"as_dict.return_value": {"pull_request_id": i}}) for i in range(2)],
+        [MagicMock(**{"as_dict.return_value": {"pull_request_id": 2}})]
+    ]
+    client._azdo.get_pull_requests_by_project.side_effect = pages
+    results = client.iter_pull_requests("RunwayTest", page_size=2)
+    assert next(results) == {"pull_request_id": 0}
+    assert client._azdo.get_pull_requests_by_project.call_count == 1
+    assert [pr["pull_request_id"] for pr in results] == [1, 2]
+    assert client._azdo.get_pull_requests_by_project.call_count == 2
+    assert client._azdo.get_pull_requests_by_project.call_args[1] == {"skip": 2, "top": 2}
+
+def test_iter_pull_requests_builds_search_criteria():
+    client = offline_client()
+    client._azdo.get_repository.return_value = MagicMock(id="repo-id")
+    client._azdo.get_pull_requests_by_project.return_value = []
+    assert list(client.iter_pull_requests("RunwayTest", repo="WorldDomination", source="feature/Utopia")) == []
+    criteria = client._azdo.get_pull_requests_by_project.call_args[0][1]
+    assert criteria.repository_id == "repo-id"
+    assert criteria.source_ref_name == "refs/heads/feature/Utopia"
+    assert criteria.target_ref_name is None
+
+def test_project_snapshot_partitions_pull_requests_by_repo():
+    client = offline_client()
+    repos = [GitRepository(id=f"id-{name}", name=name) for name in ("Utopia", "Dystopia")]
+    prs = [
+        GitPullRequest(pull_request_id=number, title=f"PR {number}", repository=repos[number % 2])
+        for number in range(5)
+    ]
+    client._azdo.get_repositories.return_value = repos
+    client._azdo.get_pull_requests_by_project.return_value = prs
+    assert [pr["pull_request_id"] for pr in client.pull_requests_for_repo("RunwayTest", "Utopia")] == [0, 2, 4]
+    assert [pr["pull_request_id"] for pr in client.pull_requests_for_repo("RunwayTest", "dystopia")] == [1, 3]
+    assert client.load_pull_request("RunwayTest", "Dystopia", "PR 3")["pull_request_id"] == 3
+    assert client._azdo.get_pull_requests_by_project.call_count == 1
+    assert client._azdo.get_repositories.call_count == 1
+    client._azdo.get_repository.assert_not_called()
+    client._snapshot_max_age = 0
+    client.pull_requests_for_repo("RunwayTest", "Utopia")
+    assert client._azdo.get_pull_requests_by_project.call_count == 2
+
+def test_project_snapshot_refreshes_on_miss():
+    client = offline_client()
+    utopia = GitRepository(id="id-Utopia", name="Utopia")
+    dystopia = GitRepository(id="id-Dystopia", name="Dystopia")
+    pr = GitPullRequest(pull_request_id=1, title="PR 1", repository=utopia)
+    client._azdo.get_repositories.side_effect = [[utopia], [utopia], [utopia, dystopia]]
+    client._azdo.get_pull_requests_by_project.side_effect = [[], [pr], [pr]]
+    # A snapshot fetched for this call is not fetched again
+    assert client.load_pull_request("RunwayTest", "Utopia", "PR 1") is None
+    assert client._azdo.get_pull_requests_by_project.call_count == 1
+    # A reused snapshot is refreshed once when the PR is missing
+    assert client.load_pull_request("RunwayTest", "Utopia", "PR 1")["pull_request_id"] == 1
+    assert client._azdo.get_pull_requests_by_project.call_count == 2
+    # ... or when the repo is missing
+    assert client.pull_requests_for_repo("RunwayTest", "Dystopia") == []
+    assert client._azdo.get_repositories.call_count == 3
+    client._azdo.get_repository.assert_not_called()
@@ -0,0 +1,93 @@
+import os
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import requests
+
+from librtl.cache import ConditionalRequestAdapter, ResponseCache
+
+class ETagHandler(BaseHTTPRequestHandler):
+    requests_seen = []
+
+    def do_GET(self):
+        ETagHandler.requests_seen.append(dict(self.headers))
+        if self.headers.get("If-None-Match") == '"v1"':
+            self.send_response(304)
+            self.send_header("ETag", '"v1"')
+            self.end_headers()
+            return
+        body = b'{"value": 1}'
+        self.send_response(200)
+        self.send_header("ETag", '"v1"')
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def serve():
+    server = HTTPServer(("127.0.0.1", 0), ETagHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def cached_session(cache):
+    session = requests.Session()
+    session.mount("http://", ConditionalRequestAdapter(cache))
+    return session
+
+def test_not_modified_is_served_from_cache():
+    server = serve()
+    url = f"http://127.0.0.1:{server.server_port}/repos"
+    cache = ResponseCache(os.path.join("/tmp", str(uuid.uuid4())))
+    ETagHandler.requests_seen = []
+    first = cached_session(cache).get(url)
+    second = cached_session(cache).get(url)
+    server.shutdown()
+    assert first.json() == second.json() == {"value": 1}
+    assert second.status_code == 200
+    assert second.from_cache
+    assert "If-None-Match" not in ETagHandler.requests_seen[0]
+    assert ETagHandler.requests_seen[1]["If-None-Match"] == '"v1"'
+
+def test_evicts_least_recently_used():
+    cache = ResponseCache(os.path.join("/tmp", str(uuid.uuid4())), max_bytes=100)
+    for index in range(3):
+        response = requests.Response()
+        response._content = b"x" * 40
+        cache.store(f"entry{index}", response)
+        os.utime(os.path.join(cache.directory, f"entry{index}"), (index, index))
+    cache.evict()
+    assert cache.load("entry0") is None
+    assert cache.load("entry2") is not None
+
+def test_store_failures_are_ignored():
+    cache = ResponseCache(os.path.join("/tmp", str(uuid.uuid4())))
+    os.rmdir(cache.directory)
+    response = requests.Response()
+    response._content = b"{}"
+    cache.store("entry", response)
+    assert cache.load("entry") is None
+
+def test_load_headers_are_case_insensitive():
+    cache = ResponseCache(os.path.join("/tmp", str(uuid.uuid4())))
+    response = requests.Response()
+    response.headers["etag"] = '"v1"'
+    response._content = b"{}"
+    cache.store("entry", response)
+    headers, _ = cache.load("entry")
+    assert headers["ETag"] == '"v1"'
+
+def test_shared_directory_disables_caching():
+    directory = os.path.join("/tmp", str(uuid.uuid4()))
+    os.makedirs(directory)
+    os.chmod(directory, 0o777)
+    cache = ResponseCache(directory)
+    response = requests.Response()
+    response.headers["ETag"] = '"v1"'
+    response._content = b"{}"
+    cache.store("entry", response)
+    assert not cache.enabled
+    assert os.listdir(directory) == []
@@ -0,0 +1,76 @@
+import importlib.util
+import os
+import uuid
+from importlib.machinery import SourceFileLoader
+
+from pylint.lint import Run as RunPylint
+
+HOME = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# bin/ci is a script without a .py suffix, so it is loaded from its path
+ci = importlib.util.module_from_spec(importlib.util.spec_from_loader(
+    "ci", SourceFileLoader("ci", os.path.join(HOME, "bin", "ci"))))
+ci.__loader__.exec_module(ci)
+
+def write(home, path, content):
+    path = os.path.join(home, path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as opf:
+        opf.write(content)
+    return path
+
+def setup_home():
+    home = os.path.join("/tmp", str(uuid.uuid4()))
+    write(home, "librtl/__init__.py", "")
+    write(home, "librtl/client.py", "from .model import Model\n")
+    write(home, "librtl/model/__init__.py", "from ..paths import user_dir\n")
+    write(home, "librtl/paths.py", "import os\nfrom . import log\n")
+    write(home, "librtl/log.py", "")
+    write(home, "librtl/unused.py", "")
+    test_file = write(home, "tests/test_client.py", "import pytest\nfrom librtl.client import Model\n")
+    return home, test_file
+
+def test_local_imports_follows_relative_imports_transitively():
+    home, test_file = setup_home()
+    found = {os.path.relpath(path, home) for path in ci.local_imports(home, test_file)}
+    assert found == {
+        "librtl/__init__.py", "librtl/client.py", "librtl/model/__init__.py", "librtl/paths.py",
+        "librtl/log.py"
+    }
+
+def test_local_imports_of_the_real_tree():
+    found = ci.local_imports(HOME, os.path.join(HOME, "tests", "test_daemon.py"))
+    assert os.path.join(HOME, "librtl", "paths.py") in found
+
+def test_changing_an_imported_module_changes_the_key():
+    home, test_file = setup_home()
+    key = lambda: ci.digest(home, [test_file, *ci.local_imports(home, test_file)])
+    before = key()
+    write(home, "librtl/unused.py", "CHANGED = True\n")
+    assert key() == before
+    write(home, "librtl/log.py", "CHANGED = True\n")
+    assert key() != before
+
+def test_evaluate_matches_pylint():
+    home, _ = setup_home()
+    module = write(home, "librtl/bad.py", "import os\n\ndef f(x):\n    y = 1\n    return missing + x\n")
+    rcfile = os.path.join(HOME, ".pylintrc")
+    try:
+        stats = RunPylint([module, "--rcfile", rcfile], exit=False).linter.stats
+    except TypeError:
+        stats = RunPylint([module, "--rcfile", rcfile], do_exit=False).linter.stats
+    stat = stats.get if isinstance(stats, dict) else lambda name: getattr(stats, name)
+    totals = {name: stat(name) for name in ["error", "warning", "refactor", "convention", "statement"]}
+    assert totals["error"] and totals["warning"]
+    assert ci.CLI.evaluate(rcfile, totals) == stat("global_note")
+
+def test_result_cache_evicts_least_recently_used():
+    home, test_file = setup_home()
+    cache = ci.ResultCache(os.path.join(home, ".ci-cache"), max_bytes=100)
+    for key in ("first", "second"):
+        cache.store("unit", key, {"unit.xml": write(home, f"{key}.xml", "x" * 40)})
+        os.utime(os.path.join(cache.directory, "unit", key), (0, 0))
+    assert cache.load("unit", "first") is not None
+    cache.store("unit", "third", {"unit.xml": write(home, "third.xml", "x" * 40)})
+    assert cache.load("unit", "second") is None
+    assert cache.load("unit", "first") is not None
+    assert cache.load("unit", "third") is not None
@@ -0,0 +1,117 @@
+import io
+import json
+import os
+import socket
+import sys
+import threading
+import time
+import uuid
+
+from librtl.cli import CLI
+from librtl.daemon import RequestHandler, RtlDaemon, forward, send_frame
+
+def start_daemon(runner):
+    socket_path = os.path.join("/tmp", f"{uuid.uuid4()}.sock")
+    server = RtlDaemon(runner, socket_path, idle_timeout=5)
+    threading.Thread(target=server.serve, kwargs={"poll_interval": 0.1}, daemon=True).start()
+    return server
+
+def test_forward_without_daemon_returns_none():
+    assert forward(["list-prs", "RunwayTest"], socket_path=os.path.join("/tmp", str(uuid.uuid4()))) is None
+
+def test_forward_relays_output_and_exit_code():
+    calls = []
+    def runner(args):
+        calls.append(args)
+        print("hello from the daemon")
+        print("oops", file=sys.stderr)
+        sys.exit(3)
+    server = start_daemon(runner)
+    out, err = io.StringIO(), io.StringIO()
+    for _ in range(2):
+        assert forward(["find-pr", "RunwayTest"], "test-token", server.socket_path, out, err) == 3
+    assert out.getvalue() == "hello from the daemon\n" * 2
+    assert err.getvalue() == "oops\n" * 2
+    assert calls[0] == ["--token", "test-token", "find-pr", "RunwayTest"]
+    assert (os.stat(server.socket_path).st_mode & 0o077) == 0
+
+def test_refuses_to_replace_live_daemon():
+    server = start_daemon(lambda args: None)
+    try:
+        RtlDaemon(lambda args: None, server.socket_path)
+        assert False, "expected RuntimeError"
+    except RuntimeError:
+        pass
+
+def test_commands_run_concurrently():
+    barrier = threading.Barrier(2, timeout=5)
+    def runner(args):
+        # Both commands must be inside the runner at once to get past the barrier
+        barrier.wait()
+        print(args[-1])
+    server = start_daemon(runner)
+    outputs = [io.StringIO(), io.StringIO()]
+    codes = []
+    threads = [
+        threading.Thread(target=lambda out=out, name=name: codes.append(
+            forward([name], socket_path=server.socket_path, stdout=out)))
+        for out, name in zip(outputs, ("first", "second"))
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert codes == [0, 0]
+    assert [out.getvalue() for out in outputs] == ["first\n", "second\n"]
+
+def test_forward_ignores_paths_that_are_not_sockets():
+    path = os.path.join("/tmp", str(uuid.uuid4()))
+    with open(path, "w") as opf:
+        opf.write("not a socket")
+    err = io.StringIO()
+    assert forward(["list-prs", "RunwayTest"], "test-token", path, stderr=err) is None
+    assert "not a socket owned by this user" in err.getvalue()
+
+def test_output_waits_for_a_stalled_reader(monkeypatch):
+    monkeypatch.setattr(RequestHandler, "timeout", 0.2)
+    def runner(args):
+        for line in range(20000):
+            print(f"line {line}")
+    server = start_daemon(runner)
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.connect(server.socket_path)
+    with client, client.makefile("rwb") as stream:
+        send_frame(stream, {"args": ["list-prs", "RunwayTest"]})
+        # Long enough for the daemon to fill the socket buffer and block writing
+        time.sleep(1)
+        frames = [json.loads(line.decode("utf-8")) for line in stream]
+    assert frames[-1] == {"exit": 0}
+    output = "".join(frame["data"] for frame in frames[:-1])
+    assert output == "".join(f"line {line}\n" for line in range(20000))
+
+def test_idle_timeout_waits_for_running_commands():
+    release = threading.Event()
+    socket_path = os.path.join("/tmp", f"{uuid.uuid4()}.sock")
+    server = RtlDaemon(lambda args: release.wait(5), socket_path, idle_timeout=0.2)
+    serving = threading.Thread(target=server.serve, kwargs={"poll_interval": 0.05}, daemon=True)
+    serving.start()
+    codes = []
+    client = threading.Thread(target=lambda: codes.append(forward(["create-pr"], socket_path=socket_path)))
+    client.start()
+    time.sleep(0.6)
+    assert serving.is_alive()
+    release.set()
+    client.join()
+    serving.join(timeout=5)
+    assert codes == [0]
+    assert not serving.is_alive()
+
+def test_broken_pipe_under_daemon_leaks_no_descriptors():
+    def records():
+        yield {"id": 1}
+        raise BrokenPipeError()
+    server = start_daemon(lambda args: CLI.stream(records()))
+    before = len(os.listdir("/proc/self/fd"))
+    for _ in range(20):
+        assert forward(["list-prs", "RunwayTest"], socket_path=server.socket_path, stdout=io.StringIO()) == 1
+    assert len(os.listdir("/proc/self/fd")) <= before + 1
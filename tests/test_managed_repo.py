@@ -1,9 +1,12 @@
 import os
+import threading
 import uuid
+from unittest.mock import patch
 
 import git
 from azure.devops.v5_1.git.models import GitRepository, TeamProjectReference
 
+from librtl.lock import FileLock
 from librtl.model import ManagedRepository
 
 def setup_repo():
@@ -20,3 +23,75 @@ def test_ensures_default_files():
     assert repo.has_file("rtl/self.yaml")
     assert repo.has_file("rtl/Dockerfile.component")
     assert repo.has_file("README.md")
+
+def test_push_rebases_onto_concurrent_change(monkeypatch):
+    monkeypatch.setattr(ManagedRepository, "PUSH_BACKOFF", 0)
+    for variable in ("GIT_AUTHOR", "GIT_COMMITTER"):
+        monkeypatch.setenv(f"{variable}_NAME", "librtl")
+        monkeypatch.setenv(f"{variable}_EMAIL", "librtl@example.com")
+    remote = setup_repo()
+    repo = ManagedRepository(remote, [])
+    repo.checkout("master")
+    other = ManagedRepository(remote, [])
+    repo.add_file("concurrent.txt", "Hello, World!")
+    repo.commit("Concurrent change")
+    repo.push()
+    remote_master = git.Repo(remote.ssh_url[len("file:///"):]).commit("master")
+    assert remote_master.message.strip() == "Concurrent change"
+    assert remote_master.parents[0].hexsha == other._local.commit("master").hexsha
+
+def test_file_lock_is_exclusive():
+    name = str(uuid.uuid4())
+    acquired = threading.Event()
+    def contender():
+        with FileLock(name):
+            acquired.set()
+    with FileLock(name):
+        thread = threading.Thread(target=contender)
+        thread.start()
+        assert not acquired.wait(0.2)
+    thread.join()
+    assert acquired.is_set()
+    assert os.stat(FileLock.DEFAULT_DIR).st_mode & 0o777 == 0o700
+
+def test_file_lock_refuses_shared_directory():
+    directory = os.path.join("/tmp", str(uuid.uuid4()))
+    os.makedirs(directory)
+    os.chmod(directory, 0o777)
+    try:
+        with FileLock("repo", directory):
+            assert False, "expected RuntimeError"
+    except RuntimeError:
+        pass
+
+def test_local_changes_do_not_spawn_git():
+    repo = ManagedRepository(setup_repo(), [])
+    with patch.object(git.cmd.Git, "execute", side_effect=AssertionError("spawned git")):
+        repo._local.create_head("feature/Utopia")
+        repo.checkout("feature/Utopia")
+        repo.add_file("greeting.txt", "Hello, World!")
+        repo.commit("Greetings")
+    assert repo._local.active_branch.name == "feature/Utopia"
+    assert repo._local.head.commit.message == "Greetings"
+    assert "greeting.txt" in repo._local.head.commit.tree
+
+def test_leaves_ssh_environment_alone_without_multiplexing(monkeypatch):
+    monkeypatch.setenv("RTL_SSH_PERSIST", "0")
+    repo = ManagedRepository(setup_repo(), [])
+    assert "GIT_SSH_COMMAND" not in repo._local.git.environment()
+
+def test_push_declined_by_policy_is_not_retried():
+    remote = setup_repo()
+    repo = ManagedRepository(remote, [])
+    hook = os.path.join(remote.ssh_url[len("file:///"):], "hooks", "pre-receive")
+    with open(hook, "w") as opf:
+        opf.write("#!/bin/sh\necho 'TF402455: Pushes to this branch are not permitted' >&2\nexit 1\n")
+    os.chmod(hook, 0o755)
+    repo.add_file("policy.txt", "Hello, World!")
+    repo.commit("Blocked by policy")
+    with patch.object(git.Remote, "fetch", side_effect=AssertionError("retried")):
+        try:
+            repo.push()
+            assert False, "expected GitCommandError"
+        except git.GitCommandError as exc:
+            assert "TF402455" in str(exc)
@@ -0,0 +1,44 @@
+import os
+import uuid
+
+from librtl.ssh import git_ssh_command
+
+def test_git_ssh_command_multiplexes():
+    control_dir = os.path.join("/tmp", str(uuid.uuid4()))
+    command = git_ssh_command(persist=30, control_dir=control_dir)
+    assert command.startswith("ssh ")
+    assert "-o ControlMaster=auto" in command
+    assert f"-o ControlPath={control_dir}/%C" in command
+    assert "-o ControlPersist=30" in command
+    assert os.stat(control_dir).st_mode & 0o777 == 0o700
+
+def test_git_ssh_command_extends_environment(monkeypatch):
+    monkeypatch.setenv("GIT_SSH_COMMAND", "ssh -i deploy_key")
+    monkeypatch.setenv("RTL_SSH_PERSIST", "0")
+    assert git_ssh_command() is None
+    assert git_ssh_command(persist=5).startswith("ssh -i deploy_key -o ControlMaster=auto")
+
+def test_git_ssh_command_accepts_ssh_time_formats(monkeypatch):
+    monkeypatch.setenv("RTL_SSH_PERSIST", "10m")
+    assert "-o ControlPersist=10m" in git_ssh_command(control_dir=os.path.join("/tmp", str(uuid.uuid4())))
+
+def test_git_ssh_command_skips_shared_control_dir():
+    control_dir = os.path.join("/tmp", str(uuid.uuid4()))
+    os.makedirs(control_dir)
+    os.chmod(control_dir, 0o777)
+    assert git_ssh_command(persist=30, control_dir=control_dir) is None
+
+def test_git_ssh_command_extends_core_ssh_command(monkeypatch):
+    home = os.path.join("/tmp", str(uuid.uuid4()))
+    os.makedirs(home)
+    with open(os.path.join(home, ".gitconfig"), "w") as opf:
+        opf.write("[core]\n\tsshCommand = ssh -i wrapper_key\n")
+    monkeypatch.setenv("HOME", home)
+    monkeypatch.delenv("GIT_SSH_COMMAND", raising=False)
+    control_dir = os.path.join("/tmp", str(uuid.uuid4()))
+    assert git_ssh_command(persist=30, control_dir=control_dir).startswith(
+        "ssh -i wrapper_key -o ControlMaster=auto")
+
+def test_git_ssh_command_leaves_git_ssh_alone(monkeypatch):
+    monkeypatch.setenv("GIT_SSH", "/usr/local/bin/ssh-wrapper")
+    assert git_ssh_command(persist=30, control_dir=os.path.join("/tmp", str(uuid.uuid4()))) is None